@@ -0,0 +1,43 @@
+"""create equipment_write_versions table
+
+Revision ID: 5d1f0c7a2e84
+Revises: cb24105f05ef
+Create Date: 2026-10-19 09:12:37.418250
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f0c7a2e84'
+down_revision: Union[str, None] = 'cb24105f05ef'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'equipment_write_versions',
+        sa.Column('equipment_id', sa.String(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('equipment_id')
+    )
+
+    # Seed a version for equipment that already has readings so existing
+    # data gets a validator without waiting for the next write.
+    op.execute(
+        """
+        INSERT INTO equipment_write_versions (equipment_id, version, updated_at)
+        SELECT equipment_id, 1, MAX(created_at)
+        FROM sensor_readings
+        GROUP BY equipment_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('equipment_write_versions')
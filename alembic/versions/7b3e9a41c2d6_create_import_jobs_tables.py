@@ -0,0 +1,59 @@
+"""create import_jobs tables
+
+Revision ID: 7b3e9a41c2d6
+Revises: 5d1f0c7a2e84
+Create Date: 2026-10-19 14:03:51.227904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e9a41c2d6'
+down_revision: Union[str, None] = '5d1f0c7a2e84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'import_jobs',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('file_path', sa.String(), nullable=False),
+        sa.Column('file_size', sa.BigInteger(), nullable=False),
+        sa.Column('partitions', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_import_jobs_status', 'import_jobs', ['status'])
+
+    op.create_table(
+        'import_job_chunks',
+        sa.Column('job_id', sa.String(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('start_offset', sa.BigInteger(), nullable=False),
+        sa.Column('end_offset', sa.BigInteger(), nullable=False),
+        sa.Column('first_line', sa.BigInteger(), nullable=False),
+        sa.Column('written_partitions', sa.BigInteger(), nullable=False),
+        sa.Column('done', sa.Boolean(), nullable=False),
+        sa.Column('rows_imported', sa.Integer(), nullable=False),
+        sa.Column('rows_failed', sa.Integer(), nullable=False),
+        sa.Column('error_samples', sa.JSON(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['import_jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('job_id', 'chunk_index')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('import_job_chunks')
+    op.drop_index('idx_import_jobs_status')
+    op.drop_table('import_jobs')
@@ -33,4 +33,29 @@ class CreateUserRequest(BaseModel):
 
 class LoginRequest(BaseModel):
     email: str
-    password: str
\ No newline at end of file
+    password: str
+
+class ImportJobCreatedResponse(BaseModel):
+    job_id: str
+    status: str
+
+class ImportRowError(BaseModel):
+    chunk: int
+    line: int
+    error: str
+
+class ImportJobStatusResponse(BaseModel):
+    job_id: str
+    filename: str
+    status: str
+    error: Optional[str]
+    bytes_total: int
+    bytes_processed: int
+    progress: float
+    rows_imported: int
+    rows_failed: int
+    rows_per_second: Optional[float]
+    error_samples: List[ImportRowError]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = 1024
+GZIP_COMPRESS_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Checked in this order when two encodings share the highest q-value.
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+def negotiate_encoding(request: Request) -> Optional[str]:
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+
+    best_encoding, best_quality = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+def make_etag(*parts: Any) -> str:
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        hasher.update(b"\x00")
+    return f'"{hasher.hexdigest()[:32]}"'
+
+def _encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    # Each content coding is its own representation and needs its own tag.
+    if not encoding:
+        return etag
+    opaque = etag.strip('"')
+    return f'"{opaque}-{encoding}"'
+
+def matching_etag(request: Request, etag: str, encoding: Optional[str]) -> Optional[str]:
+    # Whether the body is compressed depends on its size, which is unknown
+    # before the query runs. The client echoes back whichever tag its 200
+    # carried, so either form matches and is what the 304 has to repeat.
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() == "*":
+        return etag
+
+    candidates = {etag, _encoded_etag(etag, encoding)}
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in candidates:
+            return candidate
+    return None
+
+def render_json(content: Any) -> bytes:
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_cache_headers(etag))
+
+def cached_json_response(body: bytes, etag: str, encoding: Optional[str]) -> Response:
+    if len(body) < COMPRESSION_MIN_SIZE:
+        encoding = None
+    headers = _cache_headers(_encoded_etag(etag, encoding))
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL, mtime=0)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _cache_headers(etag: str) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+    }
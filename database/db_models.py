@@ -1,7 +1,12 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Boolean, JSON, ForeignKey, Index
 from .db_engine import Base
 from datetime import datetime
 
+IMPORT_JOB_PENDING = "pending"
+IMPORT_JOB_RUNNING = "running"
+IMPORT_JOB_COMPLETED = "completed"
+IMPORT_JOB_FAILED = "failed"
+
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
     
@@ -18,10 +23,58 @@ class SensorReading(Base):
     def __repr__(self):
         return f"<SensorReading(equipment_id={self.equipment_id}, timestamp={self.timestamp}, value={self.value})>"
 
+class EquipmentWriteVersion(Base):
+    __tablename__ = "equipment_write_versions"
+
+    equipment_id = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<EquipmentWriteVersion(equipment_id={self.equipment_id}, version={self.version})>"
+
 class User(Base):
     __tablename__ = 'users'
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     email = Column(String, unique=True, index=True)
-    password = Column(String)
\ No newline at end of file
+    password = Column(String)
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True)
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    # Rows are split between this many writers by equipment id.
+    partitions = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default=IMPORT_JOB_PENDING)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_import_jobs_status', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<ImportJob(id={self.id}, status={self.status})>"
+
+class ImportJobChunk(Base):
+    __tablename__ = "import_job_chunks"
+
+    job_id = Column(String, ForeignKey("import_jobs.id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    start_offset = Column(BigInteger, nullable=False)
+    end_offset = Column(BigInteger, nullable=False)
+    first_line = Column(BigInteger, nullable=False)
+    # Bit i is set once partition i of the chunk is committed.
+    written_partitions = Column(BigInteger, nullable=False, default=0)
+    done = Column(Boolean, nullable=False, default=False)
+    rows_imported = Column(Integer, nullable=False, default=0)
+    rows_failed = Column(Integer, nullable=False, default=0)
+    error_samples = Column(JSON, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
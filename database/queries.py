@@ -1,8 +1,38 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case
+from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime, timedelta
-from .db_models import SensorReading
-from typing import List, Dict, Any
+from .db_models import (
+    SensorReading, EquipmentWriteVersion, ImportJob, ImportJobChunk,
+    IMPORT_JOB_PENDING, IMPORT_JOB_RUNNING, IMPORT_JOB_COMPLETED, IMPORT_JOB_FAILED
+)
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+WRITE_VERSION_BATCH_SIZE = 1000
+IMPORT_WRITE_BATCH_SIZE = 5000
+IMPORT_ERROR_SAMPLE_LIMIT = 20
+
+def _upsert_write_versions(db: Session, equipment_ids: Iterable[str]) -> None:
+    # Runs inside the caller's transaction, so the version only moves when
+    # the readings it describes are committed. Ids are sorted so concurrent
+    # writers always lock version rows in the same order.
+    ids = sorted(set(equipment_ids))
+    now = datetime.utcnow()
+
+    for i in range(0, len(ids), WRITE_VERSION_BATCH_SIZE):
+        batch = ids[i:i + WRITE_VERSION_BATCH_SIZE]
+        stmt = insert(EquipmentWriteVersion).values([
+            {"equipment_id": equipment_id, "version": 1, "updated_at": now}
+            for equipment_id in batch
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[EquipmentWriteVersion.equipment_id],
+            set_={
+                "version": EquipmentWriteVersion.version + 1,
+                "updated_at": stmt.excluded.updated_at
+            }
+        )
+        db.execute(stmt)
 
 class SensorQueries:
 
@@ -13,7 +43,10 @@ class SensorQueries:
 
     @staticmethod
     async def get_unique_equipment_ids(db: Session) -> List[str]:
-        equipment_ids = db.query(SensorReading.equipment_id).distinct().all()
+        equipment_ids = db.query(SensorReading.equipment_id)\
+            .distinct()\
+            .order_by(SensorReading.equipment_id)\
+            .all()
         return [id_[0] for id_ in equipment_ids] 
 
     @staticmethod
@@ -24,10 +57,26 @@ class SensorQueries:
             value=reading["value"]
         )
         db.add(db_reading)
+        await SensorQueries.bump_write_versions(db, [reading["equipment_id"]])
         db.commit()
         db.refresh(db_reading)
         return db_reading
 
+    @staticmethod
+    async def bump_write_versions(db: Session, equipment_ids: Iterable[str]) -> None:
+        _upsert_write_versions(db, equipment_ids)
+
+    @staticmethod
+    async def get_write_version(db: Session, equipment_id: str) -> int:
+        version = db.query(EquipmentWriteVersion.version)\
+            .filter(EquipmentWriteVersion.equipment_id == equipment_id)\
+            .scalar()
+        return int(version) if version else 0
+
+    @staticmethod
+    async def get_equipment_count(db: Session) -> int:
+        return db.query(func.count(EquipmentWriteVersion.equipment_id)).scalar() or 0
+
     @staticmethod
     async def get_readings_by_equipment(
         db: Session, 
@@ -82,6 +131,7 @@ class SensorQueries:
 
             if reading:
                 reading.value = new_value
+                await SensorQueries.bump_write_versions(db_session, [equipment_id])
                 db_session.commit()
                 return True
             else:
@@ -91,6 +141,7 @@ class SensorQueries:
                     value=new_value
                 )
                 db_session.add(new_reading)
+                await SensorQueries.bump_write_versions(db_session, [equipment_id])
                 db_session.commit()
                 return True
         except IntegrityError as e:
@@ -98,4 +149,222 @@ class SensorQueries:
             raise Exception(f"Database error: {str(e)}")
         except Exception as e:
             db_session.rollback()
-            raise Exception(f"Error updating or inserting reading: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error updating or inserting reading: {str(e)}")
+
+class ImportJobQueries:
+
+    @staticmethod
+    async def create_job(
+        db: Session,
+        job_id: str,
+        filename: str,
+        file_path: str,
+        file_size: int,
+        partitions: int
+    ) -> ImportJob:
+        job = ImportJob(
+            id=job_id,
+            filename=filename,
+            file_path=file_path,
+            file_size=file_size,
+            partitions=partitions,
+            status=IMPORT_JOB_PENDING
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    async def get_job(db: Session, job_id: str) -> Optional[ImportJob]:
+        return db.query(ImportJob).filter(ImportJob.id == job_id).first()
+
+    @staticmethod
+    async def get_resumable_job_ids(db: Session) -> List[str]:
+        job_ids = db.query(ImportJob.id)\
+            .filter(ImportJob.status.in_([IMPORT_JOB_PENDING, IMPORT_JOB_RUNNING]))\
+            .order_by(ImportJob.created_at)\
+            .all()
+        return [id_[0] for id_ in job_ids]
+
+    @staticmethod
+    async def get_chunks(db: Session, job_id: str) -> List[ImportJobChunk]:
+        return db.query(ImportJobChunk)\
+            .filter(ImportJobChunk.job_id == job_id)\
+            .order_by(ImportJobChunk.chunk_index)\
+            .all()
+
+    @staticmethod
+    async def create_chunks(db: Session, job_id: str, ranges: List[Tuple[int, int, int]]) -> List[ImportJobChunk]:
+        chunks = [
+            ImportJobChunk(
+                job_id=job_id,
+                chunk_index=index,
+                start_offset=start,
+                end_offset=end,
+                first_line=first_line,
+                written_partitions=0,
+                done=False,
+                rows_imported=0,
+                rows_failed=0
+            )
+            for index, (start, end, first_line) in enumerate(ranges)
+        ]
+        db.add_all(chunks)
+        db.commit()
+        return await ImportJobQueries.get_chunks(db, job_id)
+
+    @staticmethod
+    async def get_expired_failed_jobs(db: Session, before: datetime) -> List[Tuple[str, str]]:
+        jobs = db.query(ImportJob.id, ImportJob.file_path)\
+            .filter(ImportJob.status == IMPORT_JOB_FAILED, ImportJob.finished_at < before)\
+            .all()
+        return [(job_id, file_path) for job_id, file_path in jobs]
+
+    @staticmethod
+    async def reset_failed_job(db: Session, job_id: str) -> bool:
+        updated = db.query(ImportJob).filter(
+            ImportJob.id == job_id,
+            ImportJob.status == IMPORT_JOB_FAILED
+        ).update({
+            "status": IMPORT_JOB_PENDING,
+            "error": None,
+            "finished_at": None
+        })
+        db.commit()
+        return updated > 0
+
+    @staticmethod
+    async def mark_running(db: Session, job_id: str) -> None:
+        db.query(ImportJob).filter(ImportJob.id == job_id).update({
+            "status": IMPORT_JOB_RUNNING,
+            "started_at": datetime.utcnow()
+        })
+        db.commit()
+
+    @staticmethod
+    async def mark_finished(db: Session, job_id: str, error: Optional[str] = None) -> None:
+        db.rollback()
+        db.query(ImportJob).filter(ImportJob.id == job_id).update({
+            "status": IMPORT_JOB_FAILED if error else IMPORT_JOB_COMPLETED,
+            "error": error,
+            "finished_at": datetime.utcnow()
+        })
+        db.commit()
+
+    @staticmethod
+    def write_chunk(
+        db: Session,
+        job_id: str,
+        chunk_index: int,
+        partition: int,
+        partitions: int,
+        readings: Dict[str, Any],
+        rows_failed: int,
+        error_samples: List[Dict[str, Any]]
+    ) -> None:
+        # Called from the import writer threads, hence not async. The readings
+        # of one partition and its bit in the chunk commit together, so a
+        # resumed job only redoes partitions whose bit is not set.
+        bit = 1 << partition
+        equipment_ids = readings["equipment_ids"]
+        timestamps = readings["timestamps"]
+        values = readings["values"]
+        try:
+            if len(equipment_ids):
+                stmt = insert(SensorReading.__table__)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[SensorReading.equipment_id, SensorReading.timestamp],
+                    set_={"value": stmt.excluded.value}
+                )
+                for i in range(0, len(equipment_ids), IMPORT_WRITE_BATCH_SIZE):
+                    batch = slice(i, i + IMPORT_WRITE_BATCH_SIZE)
+                    db.execute(stmt, [
+                        {"equipment_id": equipment_id, "timestamp": timestamp, "value": value}
+                        for equipment_id, timestamp, value in zip(
+                            equipment_ids[batch].tolist(),
+                            timestamps[batch].astype("datetime64[us]").tolist(),
+                            values[batch].tolist()
+                        )
+                    ])
+                _upsert_write_versions(db, equipment_ids.tolist())
+
+            written = ImportJobChunk.written_partitions.op("|")(bit)
+            # A commit whose acknowledgement was lost is retried; the bit
+            # check keeps it from being counted twice.
+            db.query(ImportJobChunk).filter(
+                ImportJobChunk.job_id == job_id,
+                ImportJobChunk.chunk_index == chunk_index,
+                ImportJobChunk.written_partitions.op("&")(bit) == 0
+            ).update({
+                "written_partitions": written,
+                "done": written == (1 << partitions) - 1,
+                "rows_imported": ImportJobChunk.rows_imported + len(equipment_ids),
+                "rows_failed": rows_failed,
+                "error_samples": error_samples[:IMPORT_ERROR_SAMPLE_LIMIT],
+                "completed_at": datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    @staticmethod
+    async def get_job_status(db: Session, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await ImportJobQueries.get_job(db, job_id)
+        if job is None:
+            return None
+
+        done_chunk = ImportJobChunk.done.is_(True)
+        # Partitions of a chunk commit separately, so the rate counts every
+        # chunk written to since this run started.
+        since_start = ImportJobChunk.completed_at.isnot(None)
+        if job.started_at:
+            since_start = ImportJobChunk.completed_at >= job.started_at
+
+        totals = db.query(
+            func.coalesce(func.sum(case((done_chunk, ImportJobChunk.end_offset - ImportJobChunk.start_offset), else_=0)), 0).label('bytes_processed'),
+            func.coalesce(func.sum(ImportJobChunk.rows_imported), 0).label('rows_imported'),
+            func.coalesce(func.sum(ImportJobChunk.rows_failed), 0).label('rows_failed'),
+            func.coalesce(func.sum(case((since_start, ImportJobChunk.rows_imported), else_=0)), 0).label('rows_since_start')
+        ).filter(ImportJobChunk.job_id == job_id).first()
+
+        sampled_chunks = db.query(ImportJobChunk.chunk_index, ImportJobChunk.error_samples)\
+            .filter(ImportJobChunk.job_id == job_id, ImportJobChunk.rows_failed > 0)\
+            .order_by(ImportJobChunk.chunk_index)\
+            .limit(IMPORT_ERROR_SAMPLE_LIMIT)\
+            .all()
+        error_samples = [
+            {"chunk": chunk_index, **sample}
+            for chunk_index, samples in sampled_chunks
+            for sample in samples or []
+        ][:IMPORT_ERROR_SAMPLE_LIMIT]
+
+        rows_per_second = None
+        if job.started_at:
+            elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+            if elapsed > 0:
+                rows_per_second = int(totals.rows_since_start) / elapsed
+
+        bytes_processed = int(totals.bytes_processed)
+        if job.status == IMPORT_JOB_COMPLETED:
+            progress = 1.0
+        else:
+            progress = bytes_processed / job.file_size if job.file_size else 0.0
+
+        return {
+            "job_id": job.id,
+            "filename": job.filename,
+            "status": job.status,
+            "error": job.error,
+            "bytes_total": job.file_size,
+            "bytes_processed": bytes_processed,
+            "progress": progress,
+            "rows_imported": int(totals.rows_imported),
+            "rows_failed": int(totals.rows_failed),
+            "rows_per_second": rows_per_second,
+            "error_samples": error_samples,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at
+        }
@@ -0,0 +1,209 @@
+import csv
+import os
+import re
+import warnings
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Imported by the parser processes, keep this module free of database and
+# FastAPI imports.
+
+REQUIRED_COLUMNS = {"equipmentId", "timestamp", "value"}
+ERROR_SAMPLE_LIMIT = 20
+
+LINE_COUNT_BUFFER = 1024 * 1024
+
+def plan_chunks(path: str, chunk_bytes: int) -> List[Tuple[int, int, int]]:
+    # Splits the file into byte ranges that end on a line break, each with
+    # the file line number of its first row. Assumes no quoted field spans
+    # several lines, which holds for sensor exports.
+    with open(path, "rb") as f:
+        header = f.readline().decode("utf-8-sig")
+        columns = {column.strip() for column in next(csv.reader([header]), [])}
+        missing = REQUIRED_COLUMNS - columns
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+
+        size = os.fstat(f.fileno()).st_size
+        ranges = []
+        start = f.tell()
+        first_line = 2
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = f.tell()
+            ranges.append((start, end, first_line))
+            first_line += _count_lines(f, start, end)
+            start = end
+
+    return ranges
+
+def _count_lines(f, start: int, end: int) -> int:
+    f.seek(start)
+    lines = 0
+    remaining = end - start
+    while remaining > 0:
+        block = f.read(min(LINE_COUNT_BUFFER, remaining))
+        if not block:
+            break
+        lines += block.count(b"\n")
+        remaining -= len(block)
+    f.seek(end)
+    return lines
+
+# A time followed by "Z", "+03", "+0300" or "+03:00".
+UTC_OFFSET_PATTERN = r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:Z|[+-]\d{2}(?::?\d{2})?)$"
+
+def _parse_timestamps(raw: pd.Series) -> pd.Series:
+    # sensor_readings.timestamp has no time zone and Postgres ignores an
+    # offset cast into it, which is what update-values relies on. Keeping
+    # the wall-clock time here puts both endpoints on the same primary key.
+    timestamps = _to_wall_clock(raw)
+    if timestamps is None:
+        # Offsets differ between rows, only then strip them one by one.
+        timestamps = _to_wall_clock(_strip_offsets(raw))
+    if timestamps is None:
+        timestamps = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns]")
+
+    # The vectorised ISO 8601 path covers the usual exports; only rows it
+    # rejects pay for per-element format guessing.
+    unparsed = timestamps.isna() & (raw != "")
+    if unparsed.any():
+        fallback = raw[unparsed].str.strip().map(_parse_timestamp)
+        timestamps[unparsed] = pd.to_datetime(fallback).astype(timestamps.dtype)
+    return timestamps
+
+def _parse_timestamp(value: str):
+    # Zone names such as "UTC" are not offsets the pattern can strip, so the
+    # zone is dropped after parsing. Anything left unparsed becomes NaT and
+    # is reported as a row error.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            timestamp = pd.Timestamp(value)
+            if timestamp is pd.NaT:
+                return pd.NaT
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.tz_localize(None)
+            return timestamp.as_unit("ns")
+        except (ValueError, TypeError, OverflowError):
+            return pd.NaT
+
+def _to_wall_clock(raw: pd.Series) -> Optional[pd.Series]:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        try:
+            timestamps = pd.to_datetime(raw, errors="coerce", format="ISO8601")
+        except (ValueError, TypeError, OverflowError):
+            return None
+
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        return None
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_localize(None)
+    return timestamps
+
+def _strip_offsets(raw: pd.Series) -> pd.Series:
+    return raw.str.replace(UTC_OFFSET_PATTERN, r"\1", regex=True)
+
+SKIPPED_LINE_PATTERN = re.compile(r"Skipping line (\d+): (.*)")
+
+def parse_chunk(path: str, start: int, end: int, first_line: int, partitions: int) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(start)
+        data = f.read(end - start)
+
+    # The header is fed twice: pandas sizes rows from the first data line
+    # and would silently truncate it if that line had an extra field. The
+    # copy is dropped again below, so the chunk starts on buffer line 3.
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df = pd.read_csv(
+            BytesIO(header + header + data),
+            dtype=str,
+            keep_default_na=False,
+            skipinitialspace=True,
+            index_col=False,
+            skip_blank_lines=False,
+            on_bad_lines="warn"
+        ).iloc[1:]
+
+    def file_line(buffer_line):
+        return first_line + buffer_line - 3
+
+    # Lines pandas could not split into the header's fields never reach the
+    # frame, their warnings are the only trace left of them.
+    skipped = []
+    for warning in caught:
+        if issubclass(warning.category, pd.errors.ParserWarning):
+            skipped.extend(SKIPPED_LINE_PATTERN.findall(str(warning.message)))
+    skipped_lines = sorted(int(line) for line, _ in skipped)
+    error_samples = [
+        {"line": file_line(int(line)), "error": message.strip()}
+        for line, message in skipped
+    ]
+
+    # Every buffer line is either a frame row or a skipped line, blank lines
+    # included, so the frame rows map onto what is left in order.
+    buffer_lines = np.arange(3, 3 + len(df) + len(skipped_lines))
+    lines = file_line(np.setdiff1d(buffer_lines, skipped_lines, assume_unique=True))
+
+    df.columns = [column.strip() for column in df.columns]
+    # Leading blanks are dropped by skipinitialspace and the numeric and ISO
+    # parsers accept trailing ones, so only the id is stripped here.
+    equipment_ids = df["equipmentId"].str.rstrip()
+    blank = ((equipment_ids == "") & (df["timestamp"] == "") & (df["value"] == "")).to_numpy()
+    df, equipment_ids, lines = df[~blank], equipment_ids[~blank], lines[~blank]
+
+    timestamps = _parse_timestamps(df["timestamp"])
+    values = pd.to_numeric(df["value"], errors="coerce").astype(float)
+
+    invalid_id = (equipment_ids == "").to_numpy()
+    invalid_timestamp = timestamps.isna().to_numpy()
+    invalid_value = ~np.isfinite(values.to_numpy())
+    invalid = invalid_id | invalid_timestamp | invalid_value
+
+    for position in np.flatnonzero(invalid)[:ERROR_SAMPLE_LIMIT]:
+        problems = []
+        if invalid_id[position]:
+            problems.append("missing equipmentId")
+        if invalid_timestamp[position]:
+            problems.append(f"invalid timestamp {df['timestamp'].iat[position]!r}")
+        if invalid_value[position]:
+            problems.append(f"invalid value {df['value'].iat[position]!r}")
+        error_samples.append({"line": int(lines[position]), "error": ", ".join(problems)})
+    error_samples.sort(key=lambda sample: sample["line"])
+
+    valid = ~invalid
+    readings = pd.DataFrame({
+        "equipment_id": equipment_ids[valid].to_numpy(),
+        "timestamp": timestamps[valid].to_numpy(),
+        "value": values[valid].to_numpy()
+    })
+    # One upsert statement cannot touch the same key twice, so duplicates in
+    # the chunk keep their last line. Across chunks each partition is written
+    # in chunk order, see import_jobs.runner.
+    readings = readings.drop_duplicates(subset=["equipment_id", "timestamp"], keep="last")\
+        .sort_values(["equipment_id", "timestamp"])
+
+    # hash_array is seeded with a fixed key, so an equipment id lands in the
+    # same partition in every chunk, process and restart.
+    partition = pd.util.hash_array(readings["equipment_id"].to_numpy()) % partitions
+    # Plain arrays pickle far smaller and faster than a list of dicts on the
+    # way back from the parser process.
+    return {
+        "partitions": [
+            {
+                "equipment_ids": readings["equipment_id"].to_numpy()[partition == index],
+                "timestamps": readings["timestamp"].to_numpy()[partition == index],
+                "values": readings["value"].to_numpy()[partition == index]
+            }
+            for index in range(partitions)
+        ],
+        "rows_failed": int(invalid.sum()) + len(skipped_lines),
+        "error_samples": error_samples[:ERROR_SAMPLE_LIMIT]
+    }
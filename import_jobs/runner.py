@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy.exc import OperationalError, InterfaceError
+from starlette.concurrency import run_in_threadpool
+
+from database.db_engine import db
+from database.db_models import IMPORT_JOB_COMPLETED, IMPORT_JOB_FAILED
+from database.queries import ImportJobQueries
+from import_jobs.parsing import plan_chunks, parse_chunk
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMPORT_SPOOL_DIR = os.path.abspath(os.getenv("IMPORT_SPOOL_DIR", "spool/imports"))
+IMPORT_CHUNK_BYTES = int(os.getenv("IMPORT_CHUNK_BYTES", 32 * 1024 * 1024))
+IMPORT_PARSE_WORKERS = int(os.getenv("IMPORT_PARSE_WORKERS", os.cpu_count() or 1))
+# Each writer holds a pooled connection for a whole chunk; keep this well
+# below the engine's pool size so the API itself is not starved. A job
+# splits its rows into this many partitions by equipment id, capped by the
+# width of import_job_chunks.written_partitions.
+IMPORT_WRITE_WORKERS = int(os.getenv("IMPORT_WRITE_WORKERS", 3))
+MAX_IMPORT_PARTITIONS = 63
+# Parsed chunks held in memory until every writer is done with them.
+IMPORT_BUFFERED_CHUNKS = int(os.getenv("IMPORT_BUFFERED_CHUNKS", 2 * IMPORT_WRITE_WORKERS))
+# Dropped connections, lock timeouts and deadlocks are retried with
+# exponential backoff before the job is failed.
+IMPORT_WRITE_RETRIES = int(os.getenv("IMPORT_WRITE_RETRIES", 3))
+IMPORT_RETRY_BACKOFF_SECONDS = float(os.getenv("IMPORT_RETRY_BACKOFF_SECONDS", 1.0))
+# A failed job keeps its upload this long so it can be retried.
+IMPORT_FAILED_RETENTION_HOURS = float(os.getenv("IMPORT_FAILED_RETENTION_HOURS", 24))
+SPOOL_COPY_BUFFER = 1024 * 1024
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_write_pool: Optional[ThreadPoolExecutor] = None
+# Jobs run one at a time, each one already uses every parser process.
+_job_lock = asyncio.Lock()
+_running_tasks = set()
+
+def _get_pools() -> Tuple[ProcessPoolExecutor, ThreadPoolExecutor]:
+    global _parse_pool, _write_pool
+    if _parse_pool is None:
+        # Forking a process that runs an event loop and a connection pool is
+        # unsafe, so parser processes are spawned fresh.
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=IMPORT_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    if _write_pool is None:
+        _write_pool = ThreadPoolExecutor(max_workers=IMPORT_WRITE_WORKERS, thread_name_prefix="import-writer")
+    return _parse_pool, _write_pool
+
+def shutdown_import_pools():
+    global _parse_pool, _write_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+    if _write_pool is not None:
+        _write_pool.shutdown(wait=False, cancel_futures=True)
+        _write_pool = None
+
+def _copy_to_disk(source, path: str) -> int:
+    with open(path, "wb") as target:
+        shutil.copyfileobj(source, target, SPOOL_COPY_BUFFER)
+        return target.tell()
+
+async def spool_upload(file: UploadFile) -> Tuple[str, str, int]:
+    os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    path = os.path.join(IMPORT_SPOOL_DIR, f"{job_id}.csv")
+    try:
+        size = await run_in_threadpool(_copy_to_disk, file.file, path)
+    except Exception:
+        remove_spool(path)
+        raise
+    return job_id, path, size
+
+def import_partitions() -> int:
+    return max(1, min(IMPORT_WRITE_WORKERS, MAX_IMPORT_PARTITIONS))
+
+def schedule_import_job(job_id: str):
+    task = asyncio.create_task(run_import_job(job_id))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+
+async def resume_import_jobs():
+    # Jobs left pending or running belong to a previous server process.
+    # Finished chunks are committed, so only the remaining ones are redone.
+    with next(db.get_session()) as db_session:
+        job_ids = await ImportJobQueries.get_resumable_job_ids(db_session)
+        await _remove_expired_spools(db_session)
+
+    for job_id in job_ids:
+        logger.info(f"Resuming import job {job_id}")
+        schedule_import_job(job_id)
+
+def spool_exists(path: str) -> bool:
+    return os.path.exists(path)
+
+def remove_spool(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def _remove_expired_spools(db_session):
+    before = datetime.utcnow() - timedelta(hours=IMPORT_FAILED_RETENTION_HOURS)
+    for job_id, path in await ImportJobQueries.get_expired_failed_jobs(db_session, before):
+        if spool_exists(path):
+            logger.info(f"Removing upload of failed import job {job_id}")
+            remove_spool(path)
+
+def _write_chunk(job_id: str, chunk_index: int, partition: int, partitions: int, parsed: Dict[str, Any]):
+    with next(db.get_session()) as db_session:
+        ImportJobQueries.write_chunk(
+            db_session,
+            job_id,
+            chunk_index,
+            partition,
+            partitions,
+            parsed["partitions"][partition],
+            parsed["rows_failed"],
+            parsed["error_samples"]
+        )
+
+async def _write_with_retries(job_id: str, chunk_index: int, partition: int, partitions: int, parsed: Dict[str, Any]):
+    loop = asyncio.get_running_loop()
+    _, write_pool = _get_pools()
+    for attempt in range(IMPORT_WRITE_RETRIES + 1):
+        try:
+            return await loop.run_in_executor(write_pool, _write_chunk, job_id, chunk_index, partition, partitions, parsed)
+        except (OperationalError, InterfaceError) as e:
+            if attempt == IMPORT_WRITE_RETRIES:
+                raise
+            delay = IMPORT_RETRY_BACKOFF_SECONDS * 2 ** attempt
+            logger.warning(f"Import job {job_id}: writing chunk {chunk_index} failed, retrying in {delay}s: {str(e)}")
+            await asyncio.sleep(delay)
+
+async def _import_chunks(job_id: str, path: str, partitions: int, pending: List[Tuple[int, int, int, int, int]]):
+    # Chunks are parsed concurrently, but every partition has a single writer
+    # that commits its share of each chunk in chunk order. A reading seen on
+    # several lines therefore ends up with its last value, and writers never
+    # touch the same rows.
+    loop = asyncio.get_running_loop()
+    parse_pool, _ = _get_pools()
+    buffer = asyncio.Semaphore(IMPORT_BUFFERED_CHUNKS)
+    stop = asyncio.Event()
+    parsed = {chunk_index: loop.create_future() for chunk_index, *_ in pending}
+    readers = {chunk_index: partitions for chunk_index, *_ in pending}
+    parse_tasks = []
+
+    def fail():
+        # Wakes up writers waiting for chunks that will not be parsed now.
+        stop.set()
+        for future in parsed.values():
+            if not future.done():
+                future.set_result(None)
+
+    def release(chunk_index: int):
+        readers[chunk_index] -= 1
+        if readers[chunk_index] == 0:
+            del parsed[chunk_index]
+            buffer.release()
+
+    async def parse(chunk_index: int, start: int, end: int, first_line: int):
+        try:
+            result = await loop.run_in_executor(parse_pool, parse_chunk, path, start, end, first_line, partitions)
+        except Exception as e:
+            result = e
+        if not parsed[chunk_index].done():
+            parsed[chunk_index].set_result(result)
+
+    async def parse_all():
+        for chunk_index, start, end, first_line, _ in pending:
+            await buffer.acquire()
+            if stop.is_set():
+                return
+            parse_tasks.append(asyncio.create_task(parse(chunk_index, start, end, first_line)))
+
+    async def write_partition(partition: int):
+        bit = 1 << partition
+        try:
+            for chunk_index, _, _, _, written in pending:
+                result = await parsed[chunk_index]
+                if result is None:
+                    return
+                if isinstance(result, Exception):
+                    raise result
+                if not written & bit:
+                    await _write_with_retries(job_id, chunk_index, partition, partitions, result)
+                release(chunk_index)
+        except Exception:
+            fail()
+            raise
+
+    producer = asyncio.create_task(parse_all())
+    # Every writer runs to its end, so no writer thread can still commit
+    # once the job's final status is set.
+    results = await asyncio.gather(
+        *(write_partition(partition) for partition in range(partitions)),
+        return_exceptions=True
+    )
+    producer.cancel()
+    await asyncio.gather(producer, *parse_tasks, return_exceptions=True)
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+
+async def run_import_job(job_id: str):
+    async with _job_lock:
+        with next(db.get_session()) as db_session:
+            try:
+                job = await ImportJobQueries.get_job(db_session, job_id)
+                if job is None or job.status in (IMPORT_JOB_COMPLETED, IMPORT_JOB_FAILED):
+                    return
+
+                path = job.file_path
+                partitions = job.partitions
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"Spooled upload {path} no longer exists")
+
+                chunks = await ImportJobQueries.get_chunks(db_session, job_id)
+                if not chunks:
+                    ranges = await run_in_threadpool(plan_chunks, path, IMPORT_CHUNK_BYTES)
+                    chunks = await ImportJobQueries.create_chunks(db_session, job_id, ranges)
+                pending = [
+                    (chunk.chunk_index, chunk.start_offset, chunk.end_offset, chunk.first_line, chunk.written_partitions)
+                    for chunk in chunks if not chunk.done
+                ]
+
+                await ImportJobQueries.mark_running(db_session, job_id)
+                logger.info(f"Import job {job_id}: {len(pending)} of {len(chunks)} chunks to process")
+
+                await _import_chunks(job_id, path, partitions, pending)
+
+                await ImportJobQueries.mark_finished(db_session, job_id)
+                remove_spool(path)
+                logger.info(f"Import job {job_id} completed")
+            except Exception as e:
+                # Committed chunks stay done and the upload is kept for
+                # IMPORT_FAILED_RETENTION_HOURS, so the job can be retried.
+                logger.error(f"Error running import job {job_id}: {str(e)}")
+                await ImportJobQueries.mark_finished(db_session, job_id, error=str(e) or type(e).__name__)
+
+            await _remove_expired_spools(db_session)
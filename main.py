@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Header, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, Header, HTTPException, Depends, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from database.db_engine import db
@@ -6,11 +6,15 @@ import pandas as pd
 from io import BytesIO
 from statistics import mean
 from collections import defaultdict
-from database.queries import SensorQueries
-from database.db_models import SensorReading, User
+from bisect import bisect_left, bisect_right
+import uuid
+from database.queries import SensorQueries, ImportJobQueries
+from database.db_models import SensorReading, User, IMPORT_JOB_PENDING, IMPORT_JOB_FAILED
 from auth.auth import create_access_token, decode_access_token
+from api_utils.http_cache import negotiate_encoding, make_etag, matching_etag, not_modified, render_json, cached_json_response
+from import_jobs.runner import spool_upload, spool_exists, remove_spool, import_partitions, schedule_import_job, resume_import_jobs, shutdown_import_pools
 from sample_data import sample_data
-from api_models.sensor_model import SensorReadingCreate, SensorReadingResponse, SensorStatistics, EquipmentStatisticsResponse, CreateUserRequest, LoginRequest
+from api_models.sensor_model import SensorReadingCreate, SensorReadingResponse, SensorStatistics, EquipmentStatisticsResponse, CreateUserRequest, LoginRequest, ImportJobCreatedResponse, ImportJobStatusResponse
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict
 from passlib.context import CryptContext 
@@ -22,18 +26,35 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 app = FastAPI()
 
+# sample_data is generated randomly at import, so it is fixed for the life of
+# this process only; the token keeps validators from other processes apart.
+SAMPLE_DATA_TOKEN = uuid.uuid4().hex
+_sample_timestamps: Optional[List[datetime]] = None
+
+def get_sample_timestamps() -> List[datetime]:
+    global _sample_timestamps
+    if _sample_timestamps is None:
+        _sample_timestamps = sorted(datetime.fromisoformat(record['timestamp']) for record in sample_data)
+    return _sample_timestamps
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],  
     allow_headers=["*"],   
+    expose_headers=["ETag"],
 )
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     with next(db.get_session()) as db_session:
-        initialize_sample_data(db_session)
+        await initialize_sample_data(db_session)
+    await resume_import_jobs()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    shutdown_import_pools()
 
 def get_db():
     db_session = next(db.get_session())
@@ -42,7 +63,7 @@ def get_db():
     finally:
         db_session.close()
 
-def initialize_sample_data(db_session: Session):
+async def initialize_sample_data(db_session: Session):
     if db_session.query(SensorReading).count() == 0:
         sensor_readings = [
             SensorReading(
@@ -55,6 +76,7 @@ def initialize_sample_data(db_session: Session):
         ]
         
         db_session.bulk_save_objects(sensor_readings)
+        await SensorQueries.bump_write_versions(db_session, [entry["equipment_id"] for entry in sample_data])
         db_session.commit()
         
         logger.info("Sample data initialized.")
@@ -69,6 +91,7 @@ async def get_current_user(token: str = Depends(decode_access_token)):
             summary="Retrieve unique equipment IDs",
             description="Fetch all unique equipment IDs that have recorded sensor readings.")
 async def get_all_equipment_ids(
+    request: Request,
     authorization: str = Header(None),
     db_session: Session = Depends(get_db)
 ):
@@ -79,8 +102,17 @@ async def get_all_equipment_ids(
     await decode_access_token(access_token)
     
     try:
+        # Equipment ids are never removed, so the set only changes when a
+        # new version row appears.
+        equipment_count = await SensorQueries.get_equipment_count(db_session)
+        encoding = negotiate_encoding(request)
+        etag = make_etag("equipment-ids", equipment_count)
+        matched = matching_etag(request, etag, encoding)
+        if matched:
+            return not_modified(matched)
+
         equipment_ids = await SensorQueries.get_unique_equipment_ids(db_session)
-        return equipment_ids
+        return cached_json_response(render_json(equipment_ids), etag, encoding)
     except Exception as e:
         logger.error(f"Error retrieving unique equipment IDs: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -109,6 +141,7 @@ async def get_all_sensor_readings(
             summary="Retrieve sensor readings by equipment ID",
             description="Fetch sensor readings for a specific equipment ID, with optional time filtering.")
 async def get_sensor_readings(
+    request: Request,
     equipment_id: str,
     start_time: Optional[datetime] = None,
     end_time: Optional[datetime] = None,
@@ -123,6 +156,13 @@ async def get_sensor_readings(
     await decode_access_token(access_token)
     
     try:
+        write_version = await SensorQueries.get_write_version(db_session, equipment_id)
+        encoding = negotiate_encoding(request)
+        etag = make_etag("sensor-data", equipment_id, write_version, start_time, end_time, limit)
+        matched = matching_etag(request, etag, encoding)
+        if matched:
+            return not_modified(matched)
+
         readings = await SensorQueries.get_readings_by_equipment(
             db_session,
             equipment_id,
@@ -130,7 +170,8 @@ async def get_sensor_readings(
             end_time,
             limit
         )
-        return readings
+        body = render_json([SensorReadingResponse.model_validate(reading) for reading in readings])
+        return cached_json_response(body, etag, encoding)
     except Exception as e:
         logger.error(f"Error retrieving sensor readings: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -139,9 +180,10 @@ async def get_sensor_readings(
                 summary="Retrieve sensor readings statistics by time period and equipment_id as optional",
                 description="Fetch sensor readings statistics for a specific time period, with optional equipment_id.")
 async def get_sensor_statistics(
+    request: Request,
     time_period: int,
     authorization: str = Header(None)
-) -> List[EquipmentStatisticsResponse]:
+):
     if authorization is None or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Authorization token missing or invalid")
 
@@ -150,6 +192,21 @@ async def get_sensor_statistics(
 
     end_time = datetime.now()
     start_time = end_time - timedelta(hours=time_period)
+
+    # The window slides with the clock, but over fixed data the readings it
+    # covers are pinned down by their count and first and last timestamps.
+    timestamps = get_sample_timestamps()
+    first = bisect_left(timestamps, start_time)
+    last = bisect_right(timestamps, end_time)
+    if first >= last:
+        raise HTTPException(status_code=404, detail="No data available for the specified time period.")
+
+    encoding = negotiate_encoding(request)
+    etag = make_etag("statistics", SAMPLE_DATA_TOKEN, time_period, last - first, timestamps[first], timestamps[last - 1])
+    matched = matching_etag(request, etag, encoding)
+    if matched:
+        return not_modified(matched)
+
     equipment_stats = defaultdict(list)
 
     for record in sample_data:
@@ -173,7 +230,7 @@ async def get_sensor_statistics(
         for equipment_id, values in equipment_stats.items()
     ]
 
-    return statistics_list
+    return cached_json_response(render_json(statistics_list), etag, encoding)
 
 @app.post("/sensor-data/", response_model=dict, status_code=201, 
             summary="Create a new sensor reading",
@@ -261,6 +318,96 @@ async def update_sensor_values(
         logger.error(f"Error updating sensor values: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.post("/sensor-data/import-jobs/", response_model=ImportJobCreatedResponse, status_code=202,
+           summary="Start a background CSV import",
+           description="Upload a CSV file with equipmentId, timestamp and value columns. The file is imported in the background; poll the returned job ID for progress.")
+async def create_import_job(
+    file: UploadFile = File(...),
+    authorization: str = Header(None),
+    db_session: Session = Depends(get_db)
+):
+    if authorization is None or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authorization token missing or invalid")
+
+    access_token = authorization.split(" ")[1]
+    await decode_access_token(access_token)
+
+    try:
+        job_id, file_path, file_size = await spool_upload(file)
+    except Exception as e:
+        logger.error(f"Error spooling import upload: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    try:
+        job = await ImportJobQueries.create_job(
+            db_session,
+            job_id,
+            file.filename or f"{job_id}.csv",
+            file_path,
+            file_size,
+            import_partitions()
+        )
+    except Exception as e:
+        # Without a job row nothing would ever clean the upload up.
+        remove_spool(file_path)
+        logger.error(f"Error creating import job: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    schedule_import_job(job.id)
+    return ImportJobCreatedResponse(job_id=job.id, status=job.status)
+
+@app.get("/sensor-data/import-jobs/{job_id}", response_model=ImportJobStatusResponse,
+            summary="Retrieve import job status",
+            description="Fetch progress, throughput and sampled row errors of a background CSV import.")
+async def get_import_job_status(
+    job_id: str,
+    authorization: str = Header(None),
+    db_session: Session = Depends(get_db)
+):
+    if authorization is None or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authorization token missing or invalid")
+
+    access_token = authorization.split(" ")[1]
+    await decode_access_token(access_token)
+
+    try:
+        job_status = await ImportJobQueries.get_job_status(db_session, job_id)
+    except Exception as e:
+        logger.error(f"Error retrieving import job status: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    if job_status is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job_status
+
+@app.post("/sensor-data/import-jobs/{job_id}/retry", response_model=ImportJobCreatedResponse, status_code=202,
+           summary="Retry a failed import job",
+           description="Resume a failed background CSV import. Chunks that were already imported are not processed again.")
+async def retry_import_job(
+    job_id: str,
+    authorization: str = Header(None),
+    db_session: Session = Depends(get_db)
+):
+    if authorization is None or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Authorization token missing or invalid")
+
+    access_token = authorization.split(" ")[1]
+    await decode_access_token(access_token)
+
+    job = await ImportJobQueries.get_job(db_session, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if job.status != IMPORT_JOB_FAILED:
+        raise HTTPException(status_code=409, detail="Only failed import jobs can be retried")
+    if not spool_exists(job.file_path):
+        raise HTTPException(status_code=409, detail="The uploaded file is no longer available, start a new import")
+
+    if not await ImportJobQueries.reset_failed_job(db_session, job_id):
+        raise HTTPException(status_code=409, detail="Only failed import jobs can be retried")
+
+    schedule_import_job(job_id)
+    return ImportJobCreatedResponse(job_id=job_id, status=IMPORT_JOB_PENDING)
+
 
 
 
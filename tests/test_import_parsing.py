@@ -0,0 +1,64 @@
+import pandas as pd
+
+from import_jobs.parsing import plan_chunks, parse_chunk
+
+
+def _parse(tmp_path, content, partitions=1):
+    path = tmp_path / "readings.csv"
+    path.write_text(content)
+    (start, end, first_line), = plan_chunks(str(path), 1024 * 1024)
+    return parse_chunk(str(path), start, end, first_line, partitions)
+
+
+def _readings(parsed):
+    return sorted(
+        (equipment_id, pd.Timestamp(timestamp), value)
+        for partition in parsed["partitions"]
+        for equipment_id, timestamp, value in zip(partition["equipment_ids"], partition["timestamps"], partition["values"])
+    )
+
+
+def test_mixed_naive_and_zone_named_timestamps(tmp_path):
+    parsed = _parse(tmp_path, (
+        "equipmentId,timestamp,value\n"
+        "EQ-1,2023-01-01T00:00:00,1\n"
+        "EQ-2,2023-01-01 10:00:00 UTC,2\n"
+        "EQ-3,2023-01-01T10:00:00+03:00,3\n"
+    ))
+
+    assert parsed["rows_failed"] == 0
+    assert _readings(parsed) == [
+        ("EQ-1", pd.Timestamp("2023-01-01 00:00:00"), 1.0),
+        ("EQ-2", pd.Timestamp("2023-01-01 10:00:00"), 2.0),
+        ("EQ-3", pd.Timestamp("2023-01-01 10:00:00"), 3.0)
+    ]
+
+
+def test_unparseable_rows_become_row_errors(tmp_path):
+    parsed = _parse(tmp_path, (
+        "equipmentId,timestamp,value\n"
+        "EQ-1,2023-01-01 10:00:00 UTC,1\n"
+        "EQ-2,not a date,2\n"
+        "EQ-3,3000-01-01,3\n"
+        ",2023-01-01T00:00:00,4\n"
+        "EQ-5,2023-01-01T00:00:00,abc\n"
+    ))
+
+    assert parsed["rows_failed"] == 4
+    assert [sample["line"] for sample in parsed["error_samples"]] == [3, 4, 5, 6]
+    assert _readings(parsed) == [("EQ-1", pd.Timestamp("2023-01-01 10:00:00"), 1.0)]
+
+
+def test_duplicates_keep_last_line_and_stay_in_one_partition(tmp_path):
+    parsed = _parse(tmp_path, (
+        "equipmentId,timestamp,value\n"
+        " EQ-1 ,2023-01-01T00:00:00,1\n"
+        "EQ-2,2023-01-01T00:00:00,2\n"
+        "EQ-1,2023-01-01T00:00:00,3\n"
+    ), partitions=4)
+
+    assert _readings(parsed) == [
+        ("EQ-1", pd.Timestamp("2023-01-01 00:00:00"), 3.0),
+        ("EQ-2", pd.Timestamp("2023-01-01 00:00:00"), 2.0)
+    ]
+    assert sum(len(partition["equipment_ids"]) > 0 for partition in parsed["partitions"]) <= 2